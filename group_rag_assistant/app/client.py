@@ -0,0 +1,44 @@
+import json
+import urllib.error
+import urllib.request
+from typing import Optional
+
+from app.config import SETTINGS
+
+# Local server: never route through http_proxy/HTTP_PROXY from the environment
+_OPENER = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+_INDEX_MISSING = "Vector index not found"
+
+
+def ask_remote(agent: str, question: str, k: int = 8) -> Optional[dict]:
+    """ask() through a running server; None if it cannot answer and the caller should run ask() itself."""
+    body = json.dumps({"agent": agent, "question": question, "k": k}).encode("utf-8")
+    req = urllib.request.Request(
+        SETTINGS.server_url.rstrip("/") + "/api/ask",
+        data=body,
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with _OPENER.open(req, timeout=600) as resp:
+            out = json.loads(resp.read())
+    except urllib.error.HTTPError:
+        return None  # error status: another service on the port, or nothing was generated
+    except urllib.error.URLError as e:
+        # urllib wraps only failures while connecting/sending the request: nothing runs server-side
+        if isinstance(e.reason, OSError):
+            return None
+        raise
+    except OSError as e:
+        # Timeout or reset while waiting for the answer: the server may still be generating it,
+        # so answering in-process as well would only run the same request twice
+        raise RuntimeError(f"server did not answer: {e}") from e
+    except ValueError:
+        return None  # not JSON: another service on the port
+
+    if not isinstance(out, dict):
+        return None
+    if not out.get("ok"):
+        if str(out.get("error", "")).startswith(_INDEX_MISSING):
+            return None  # server started before ingest; the caller builds the index
+        raise RuntimeError(f"server error: {out.get('error', 'unknown')}")
+    return {"answer": out.get("answer", ""), "sources": out.get("sources", "")}
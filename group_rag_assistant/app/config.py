@@ -13,4 +13,14 @@ class Settings:
     python_model: str = "typewriter-python"
     reviewer_model: str = "typewriter-thesis"  # optional (kannst du später ersetzen)
 
+    # How long Ollama keeps a model (and its cached prompt prefix) loaded after a call
+    keep_alive: str = "30m"
+
+    # Running `python main.py serve`; CLI questions go there first (warm caches, no startup cost)
+    server_url: str = "http://127.0.0.1:8000"
+
+    # Reuse answers for repeated questions: exact text, or near-identical for thesis/python
+    # (per agent and k, reset on re-ingest)
+    semantic_cache: bool = True
+
 SETTINGS = Settings()
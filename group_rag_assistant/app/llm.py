@@ -1,14 +1,16 @@
-from langchain_ollama import ChatOllama, OllamaEmbeddings
+from langchain_ollama import ChatOllama
 from app.config import SETTINGS
 
-def get_embeddings() -> OllamaEmbeddings:
-    return OllamaEmbeddings(model=SETTINGS.embed_model)
+# Output caps per role (tokens). Normal answers end at EOS long before; the cap
+# only bounds a runaway decode. Sized for the longest legitimate output of each role.
+MAX_TOKENS = {"thesis": 1024, "python": 2048, "reviewer": 768}
 
 def get_chat(agent: str) -> ChatOllama:
     if agent == "thesis":
-        return ChatOllama(model=SETTINGS.thesis_model, temperature=0.25)
+        return ChatOllama(model=SETTINGS.thesis_model, temperature=0.25, num_predict=MAX_TOKENS["thesis"], keep_alive=SETTINGS.keep_alive)
     if agent == "python":
-        return ChatOllama(model=SETTINGS.python_model, temperature=0.2)
+        # Greedy: the same request yields the same code (stable reports/analysis_skeleton.py)
+        return ChatOllama(model=SETTINGS.python_model, temperature=0.0, num_predict=MAX_TOKENS["python"], keep_alive=SETTINGS.keep_alive)
     if agent == "reviewer":
-        return ChatOllama(model=SETTINGS.reviewer_model, temperature=0.2)
+        return ChatOllama(model=SETTINGS.reviewer_model, temperature=0.2, num_predict=MAX_TOKENS["reviewer"], keep_alive=SETTINGS.keep_alive)
     raise ValueError(f"Unknown agent: {agent}")
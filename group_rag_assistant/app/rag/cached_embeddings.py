@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Dict, List
+
+import numpy as np
+from langchain_ollama import OllamaEmbeddings
+
+from app.config import SETTINGS
+
+CACHE_FILE = "embed_cache.sqlite"
+_SQL_BATCH = 500  # stay below SQLite's host-parameter limit
+
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+_local = threading.local()  # one connection per thread, opened on first use
+
+
+def _init_schema() -> None:
+    # Once per process: the directory, WAL mode (persisted in the file) and the table
+    global _schema_ready
+    with _schema_lock:
+        if _schema_ready:
+            return
+        SETTINGS.vectorstore_dir.mkdir(parents=True, exist_ok=True)
+        with closing(sqlite3.connect(str(SETTINGS.vectorstore_dir / CACHE_FILE), timeout=30)) as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("CREATE TABLE IF NOT EXISTS embeddings (hash BLOB PRIMARY KEY, vec BLOB NOT NULL)")
+        _schema_ready = True
+
+
+def _connect() -> sqlite3.Connection:
+    con = getattr(_local, "con", None)
+    if con is None:
+        _init_schema()
+        con = sqlite3.connect(str(SETTINGS.vectorstore_dir / CACHE_FILE), timeout=30)
+        _local.con = con
+    return con
+
+
+class CachedOllamaEmbeddings(OllamaEmbeddings):
+    """OllamaEmbeddings backed by an on-disk cache keyed by sha256(model, text)."""
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).digest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        keys = [self._key(t) for t in texts]
+        found: Dict[bytes, List[float]] = {}
+
+        con = _connect()
+        uniq = list(dict.fromkeys(keys))
+        for i in range(0, len(uniq), _SQL_BATCH):
+            batch = uniq[i: i + _SQL_BATCH]
+            marks = ",".join("?" * len(batch))
+            rows = con.execute(f"SELECT hash, vec FROM embeddings WHERE hash IN ({marks})", batch)
+            for h, vec in rows:
+                found[bytes(h)] = np.frombuffer(vec, dtype=np.float32).tolist()
+
+        # Only misses go to Ollama (duplicates within the batch are embedded once)
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        if missing:
+            vecs = super().embed_documents(list(missing.values()))
+            rows = []
+            for key, vec in zip(missing, vecs):
+                arr = np.asarray(vec, dtype=np.float32)
+                found[key] = arr.tolist()
+                rows.append((key, arr.tobytes()))
+            with con:
+                con.executemany("INSERT OR REPLACE INTO embeddings (hash, vec) VALUES (?, ?)", rows)
+
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def get_cached_embeddings() -> CachedOllamaEmbeddings:
+    return CachedOllamaEmbeddings(model=SETTINGS.embed_model)
@@ -1,76 +1,160 @@
+import os
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
+from typing import Iterator, List
+
+import numpy as np
 from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from semantic_text_splitter import TextSplitter
 
 from app.config import SETTINGS
-from app.llm import get_embeddings
+from app.rag.cached_embeddings import get_cached_embeddings
+from app.rag.loaders import ALLOWED, load_one
+from app.rag.store import READY_FILE, index_exists, open_vectorstore, write_generation
+
+EMBED_BATCH = 64   # chunks per embed request
+EMBED_WORKERS = 4  # concurrent embed requests to Ollama
+UPSERT_BATCH = 1000  # chunks held in memory / written to Chroma at once
+LOAD_WORKERS = os.cpu_count() or 1
+INLINE_LOAD_MAX = 8  # KBs with this few files are loaded in-process
+
+
+def _iter_loaded(paths: List[Path]) -> Iterator[List[Document]]:
+    """Load files in order; at most 2*workers results are pending at once."""
+    if not paths:
+        return
+    # A pool (worker start-up + imports) only pays off once there is real parsing to spread
+    if len(paths) <= INLINE_LOAD_MAX:
+        for p in paths:
+            yield load_one(p)
+        return
+    workers = min(LOAD_WORKERS, len(paths))
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        pending = deque()
+        for p in paths:
+            pending.append(ex.submit(load_one, p))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _annotate(d: Document, root_prefix: str) -> None:
+    d.metadata = d.metadata or {}
+
+    # Ensure a consistent "source" key
+    src = (
+        d.metadata.get("source")
+        or d.metadata.get("file_path")
+        or d.metadata.get("path")
+        or d.metadata.get("filename")
+    )
+    if src is not None:
+        d.metadata["source"] = str(src)
+
+    # kb_scope: public/internal based on first folder under kb/ (string compare, no stat)
+    scope = "unknown"
+    s = d.metadata.get("source", "")
+    if s.startswith(root_prefix):
+        top = s[len(root_prefix):].split(os.sep, 1)[0].lower()
+        if top in ("internal", "public"):
+            scope = top
+    d.metadata["kb_scope"] = scope
+
+
+def _walk(d: str) -> Iterator[str]:
+    """Recursive scandir; only allowed files are yielded (no Path objects, no extra stat)."""
+    try:
+        it = os.scandir(d)
+    except PermissionError:
+        return  # unreadable folder: skipped, like rglob did
+    with it:
+        for e in it:
+            if e.is_dir(follow_symlinks=False):
+                yield from _walk(e.path)
+            elif os.path.splitext(e.name)[1].lower() in ALLOWED and e.is_file():
+                yield e.path
+
 
-TEXT_EXT = {".txt", ".md", ".tex", ".bib", ".csv"}
+def iter_chunks(kb_dir: Path) -> Iterator[Document]:
+    """Load, annotate and split one file at a time, yielding its chunks."""
+    # Walk from the resolved root so every "source" string starts with root_prefix
+    kb_root = kb_dir.resolve()
+    root_prefix = str(kb_root) + os.sep
+    # Native (Rust) splitter breaks at the largest semantic unit that fits
+    # (paragraph -> line -> sentence -> word), so no fixed overlap is needed
+    splitter = TextSplitter(1200)
 
+    paths = [Path(p) for p in _walk(str(kb_root))]
 
-def load_docs(kb_dir: Path):
-    docs = []
-    for p in kb_dir.rglob("*"):
-        if p.is_dir():
-            continue
-        ext = p.suffix.lower()
-        if ext == ".pdf":
-            docs.extend(PyPDFLoader(str(p)).load())  # page metadata should exist
-        elif ext in TEXT_EXT:
-            docs.extend(TextLoader(str(p), encoding="utf-8").load())
-    return docs
+    # Disk reads and parsing overlap across processes; annotation stays in this one
+    for docs in _iter_loaded(paths):
+        for d in docs:
+            _annotate(d, root_prefix)
+            for text in splitter.chunks(d.page_content):
+                yield Document(page_content=text, metadata=d.metadata.copy())
+
+
+def _upsert(vs: Chroma, texts, metadatas, vectors) -> None:
+    # Hand the precomputed vectors straight to the collection (add_texts would re-embed)
+    vs._collection.upsert(
+        ids=[str(uuid.uuid4()) for _ in texts],
+        documents=texts,
+        metadatas=metadatas,
+        embeddings=vectors,
+    )
 
 
 def build_index() -> None:
     SETTINGS.kb_dir.mkdir(parents=True, exist_ok=True)
-    docs = load_docs(SETTINGS.kb_dir)
-    if not docs:
+    chunks = iter_chunks(SETTINGS.kb_dir)
+
+    batch = list(islice(chunks, UPSERT_BATCH))
+    if not batch:
         print("kb/ is empty. Add at least one .md/.txt/.pdf first.")
         return
 
-    kb_root = SETTINGS.kb_dir.resolve()
-
-    for d in docs:
-        d.metadata = d.metadata or {}
-
-        # Ensure a consistent "source" key
-        src = (
-            d.metadata.get("source")
-            or d.metadata.get("file_path")
-            or d.metadata.get("path")
-            or d.metadata.get("filename")
-        )
-        if src is not None:
-            d.metadata["source"] = str(src)
-
-        # Robust kb_scope: public/internal based on first folder under kb/
-        scope = "unknown"
-        try:
-            rel = Path(d.metadata.get("source", "")).resolve().relative_to(kb_root)
-            top = rel.parts[0] if rel.parts else ""
-            if top.lower() == "internal":
-                scope = "internal"
-            elif top.lower() == "public":
-                scope = "public"
-        except Exception:
-            pass
-        d.metadata["kb_scope"] = scope
-
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1200,
-        chunk_overlap=150,
-        separators=["\n\n", "\n", ". ", " ", ""],
-    )
-    chunks = splitter.split_documents(docs)
-
+    embedder = get_cached_embeddings()
     SETTINGS.vectorstore_dir.mkdir(parents=True, exist_ok=True)
-    Chroma.from_documents(
-        documents=chunks,
-        embedding=get_embeddings(),
-        persist_directory=str(SETTINGS.vectorstore_dir),
-    )
-    print(f"OK: indexed {len(chunks)} chunks into {SETTINGS.vectorstore_dir}")
+    ready = SETTINGS.vectorstore_dir / READY_FILE
+    ready.unlink(missing_ok=True)  # an interrupted rebuild must not look finished
+    vs = open_vectorstore(embedder)
+    # Rebuild from scratch: HNSW settings only apply to a new collection,
+    # and re-running ingest must not append duplicates
+    vs.reset_collection()
+
+    # Only one micro-batch of chunks is alive at a time, regardless of KB size
+    total = 0
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as ex:
+        while batch:
+            texts = [c.page_content for c in batch]
+            metadatas = [c.metadata for c in batch]
+
+            # Embed in explicit batches, several requests in flight, so Ollama never idles
+            slices = [texts[i: i + EMBED_BATCH] for i in range(0, len(texts), EMBED_BATCH)]
+            vectors = []
+            for vecs in ex.map(embedder.embed_documents, slices):
+                vectors.extend(vecs)
+
+            # Store unit vectors: query-time MMR is then plain dot products
+            V = np.asarray(vectors, dtype=np.float32)
+            V /= np.clip(np.linalg.norm(V, axis=1, keepdims=True), 1e-12, None)
+
+            _upsert(vs, texts, metadatas, V)
+            total += len(texts)
+            batch = list(islice(chunks, UPSERT_BATCH))
+
+    write_generation()
+    print(f"OK: indexed {total} chunks into {SETTINGS.vectorstore_dir}")
+
+
+def ensure_index() -> None:
+    if not index_exists():
+        build_index()
 
 
 if __name__ == "__main__":
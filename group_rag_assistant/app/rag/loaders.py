@@ -0,0 +1,42 @@
+"""File loaders for ingest.
+
+Kept free of the vector-store / LLM stack: process-pool workers import only this
+module (plus pypdfium2 and langchain_core), which matters under spawn (macOS, Windows).
+"""
+from pathlib import Path
+from typing import List
+
+import pypdfium2 as pdfium
+from langchain_core.documents import Document
+
+TEXT_EXT = {".txt", ".md", ".tex", ".bib", ".csv"}
+ALLOWED = frozenset(TEXT_EXT | {".pdf"})
+
+
+def load_pdf(path: Path) -> List[Document]:
+    """One Document per page; "page" is 0-based like PyPDFLoader's."""
+    docs = []
+    pdf = pdfium.PdfDocument(str(path))
+    try:
+        for i in range(len(pdf)):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            try:
+                text = textpage.get_text_range()
+            finally:
+                textpage.close()
+                page.close()
+            docs.append(Document(page_content=text, metadata={"source": str(path), "page": i}))
+    finally:
+        pdf.close()
+    return docs
+
+
+def load_one(p: Path) -> List[Document]:
+    ext = p.suffix.lower()
+    if ext == ".pdf":
+        return load_pdf(p)
+    if ext in TEXT_EXT:
+        text = p.read_text(encoding="utf-8", errors="replace")
+        return [Document(page_content=text, metadata={"source": str(p)})]
+    return []
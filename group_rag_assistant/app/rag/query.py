@@ -1,39 +1,56 @@
 from __future__ import annotations
 
-from typing import List
+import atexit
+import hashlib
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
 
+import numpy as np
 from langchain_chroma import Chroma
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_ollama import ChatOllama
+from ollama import Client
 
 from app.config import SETTINGS
-from app.llm import get_chat, get_embeddings
+from app.llm import get_chat
+from app.rag import semantic_cache
+from app.rag.cached_embeddings import CachedOllamaEmbeddings, get_cached_embeddings
+from app.rag.store import index_generation, open_vectorstore
+from app.rag.vector_cache import VectorRing, load_pickle, save_pickle
 
 
 def format_sources(docs: List, max_snippet: int = 220) -> str:
-    lines = []
-    seen = set()
+    out: Dict[str, str] = {}
 
     for d in docs:
         src = d.metadata.get("source", "unknown")
         page = d.metadata.get("page", None)
 
-        snippet = (d.page_content or "").replace("\n", " ").strip()
-        if len(snippet) > max_snippet:
-            snippet = snippet[:max_snippet] + "…"
+        # Dedupe before doing any string work on the chunk
+        key = f"{src}:{int(page)}" if page is not None else f"{src}"
+        if key in out:
+            continue
 
-        if page is not None:
-            key = f"{src}:{int(page)}"
-            line = f"- {src} (p.{int(page)+1}): {snippet}"
+        # Slice first so long chunks are not copied by replace; "…" only if
+        # something other than whitespace was actually cut off
+        text = (d.page_content or "").lstrip()
+        snippet = text[:max_snippet].replace("\n", " ")
+        if len(text) > max_snippet and not text[max_snippet:].isspace():
+            snippet += "…"
         else:
-            key = f"{src}"
-            line = f"- {src}: {snippet}"
+            snippet = snippet.rstrip()
 
-        if key in seen:
-            continue
-        seen.add(key)
-        lines.append(line)
+        if page is not None:
+            out[key] = f"- {src} (p.{int(page)+1}): {snippet}"
+        else:
+            out[key] = f"- {src}: {snippet}"
 
-    return "\n".join(lines)
+    return "\n".join(out.values())
 
 
 SYSTEM_HINT = {
@@ -51,41 +68,330 @@ SYSTEM_HINT = {
     ),
 }
 
+# Built once at import; message objects are not mutated by the chat model
+_SYS_MSGS = {k: SystemMessage(content=v) for k, v in SYSTEM_HINT.items()}
 
-def ask(agent: str, question: str, k: int = 8) -> dict:
-    vs = Chroma(
-        persist_directory=str(SETTINGS.vectorstore_dir),
-        embedding_function=get_embeddings(),
-    )
 
-    # Better retrieval: MMR for diversity
-    retriever = vs.as_retriever(
-        search_type="mmr",
-        search_kwargs={
-            "k": k,
-            "fetch_k": max(24, k * 3),
-            "lambda_mult": 0.6,
-        },
-    )
+# Built once per process and reused across ask() calls
+@lru_cache(maxsize=1)
+def _embedder() -> CachedOllamaEmbeddings:
+    return get_cached_embeddings()
+
+
+_vs: Optional[Chroma] = None
+_vs_lock = Lock()
+
+
+def get_vectorstore() -> Chroma:
+    # Double-checked: lock-free once initialized, and concurrent first
+    # callers (server threads) open the store only once
+    global _vs
+    if _vs is None:
+        with _vs_lock:
+            if _vs is None:
+                _vs = open_vectorstore(_embedder())
+    return _vs
+
+
+@lru_cache(maxsize=3)
+def _chat(agent: str) -> ChatOllama:
+    return get_chat(agent)
+
+
+_WARMUP_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="warmup")
+
+
+def _warmup(llm: ChatOllama) -> None:
+    # An empty chat request makes Ollama load the model without generating anything
+    try:
+        Client(host=llm.base_url).chat(model=llm.model, messages=[], keep_alive=llm.keep_alive)
+    except Exception:
+        pass
+
+
+MMR_LAMBDA = 0.75  # relevance vs. diversity weight (1.0 = pure similarity search)
 
-    docs = retriever.invoke(question)
-    context = "\n\n".join(d.page_content for d in docs)
 
-    sys = SYSTEM_HINT.get(agent, SYSTEM_HINT["thesis"])
-    prompt = (
-        "Context:\n"
-        f"{context}\n\n"
-        "User request:\n"
-        f"{question}\n"
+def _mmr(q: np.ndarray, E: np.ndarray, k: int, lambda_mult: float) -> List[int]:
+    """Greedy maximal marginal relevance over the rows of E; returns row indices.
+
+    Rows of E are unit vectors (normalized at ingest), so cosine == dot product.
+    """
+    q = q / max(float(np.linalg.norm(q)), 1e-12)
+
+    rel = E @ q      # (n,)   query relevance
+    sim = E @ E.T    # (n, n) candidate redundancy
+
+    first = int(np.argmax(rel))
+    selected = [first]
+    max_sim = sim[:, first].copy()
+    while len(selected) < min(k, len(E)):
+        score = lambda_mult * rel - (1.0 - lambda_mult) * max_sim
+        score[selected] = -np.inf
+        idx = int(np.argmax(score))
+        selected.append(idx)
+        np.maximum(max_sim, sim[:, idx], out=max_sim)
+    return selected
+
+
+def _embed_queries(questions: List[str]) -> np.ndarray:
+    # One embed request for all (cache misses only); rows are unit vectors
+    Q = np.asarray(_embedder().embed_documents(questions), dtype=np.float32)
+    Q /= np.clip(np.linalg.norm(Q, axis=1, keepdims=True), 1e-12, None)
+    return Q
+
+
+def _embed_query(question: str) -> np.ndarray:
+    return _embed_queries([question])[0]
+
+
+def _search_many(Q: np.ndarray, k: int, lambda_mult: float) -> List[List[Document]]:
+    # Better retrieval: MMR for diversity, re-ranked locally with two matmuls.
+    # All rows of Q go to Chroma as one query call.
+    res = get_vectorstore()._collection.query(
+        query_embeddings=Q.tolist(),
+        n_results=max(24, k * 3),
+        include=["embeddings", "documents", "metadatas"],
     )
 
-    llm = get_chat(agent)
-    resp = llm.invoke([
-        SystemMessage(content=sys),
-        HumanMessage(content=prompt),
-    ])
+    out = []
+    for row, q in enumerate(Q):
+        texts = res["documents"][row]
+        if not texts:
+            out.append([])
+            continue
+        E = np.asarray(res["embeddings"][row], dtype=np.float32)
+        metas = res["metadatas"][row]
+        out.append([
+            Document(page_content=texts[i], metadata=metas[i] or {})
+            for i in _mmr(q, E, k, lambda_mult)
+        ])
+    return out
+
+
+# -----------------------------
+# Retrieval cache (survives restarts)
+# -----------------------------
+RETRIEVAL_CACHE_FILE = "retrieval_cache.pkl"
+_RETRIEVAL_CACHE_MAX = 256
+
+CachedHits = Tuple[Tuple[str, dict], ...]
+
+_RETRIEVAL_LOCK = Lock()
+_RETRIEVAL_CACHE: "OrderedDict[str, CachedHits]" = OrderedDict()
+_RETRIEVAL_COLLECTION: Optional[str] = None  # collection id the entries belong to
+
+
+def _retrieval_key(question: str, k: int, lambda_mult: float) -> str:
+    return hashlib.sha256(f"{k}\0{lambda_mult}\0{question}".encode("utf-8")).hexdigest()
+
+
+def _load_retrieval_cache() -> None:
+    """Load persisted entries once, dropping them if the index was rebuilt since."""
+    global _RETRIEVAL_COLLECTION
+    if _RETRIEVAL_COLLECTION is not None:
+        return
+    _RETRIEVAL_COLLECTION = str(get_vectorstore()._collection.id)
+    data = load_pickle(SETTINGS.vectorstore_dir / RETRIEVAL_CACHE_FILE)
+    if data is not None and data.get("collection") == _RETRIEVAL_COLLECTION:
+        _RETRIEVAL_CACHE.update(data.get("entries", {}))
+
 
-    return {
-        "answer": resp.content,
+@atexit.register
+def _save_retrieval_cache() -> None:
+    with _RETRIEVAL_LOCK:
+        if _RETRIEVAL_COLLECTION is None or not _RETRIEVAL_CACHE:
+            return
+        data = {"collection": _RETRIEVAL_COLLECTION, "entries": dict(_RETRIEVAL_CACHE)}
+    save_pickle(SETTINGS.vectorstore_dir / RETRIEVAL_CACHE_FILE, data)
+
+
+# -----------------------------
+# Near-duplicate questions share retrieval (in-process)
+# -----------------------------
+NEAR_DUP_SIM = 0.97  # cosine between query embeddings above which hits are reused
+_NEAR_MAX = 256
+_NEAR: Dict[Tuple[int, float], VectorRing[CachedHits]] = {}
+
+
+# -----------------------------
+# Index rebuilds (python main.py ingest while this process runs)
+# -----------------------------
+_GENERATION: Optional[str] = None
+
+
+def _sync_index() -> None:
+    """Drop the store handle and retrieval caches if build_index() ran since the last call."""
+    global _vs, _GENERATION, _RETRIEVAL_COLLECTION
+    gen = index_generation()
+    if gen == _GENERATION:
+        return
+    # Locks taken one after the other, never nested (retrieve_many nests them the other way)
+    with _vs_lock:
+        _vs = None  # reopened on next use, against the new collection
+    with _RETRIEVAL_LOCK:
+        _RETRIEVAL_CACHE.clear()
+        _NEAR.clear()
+        _RETRIEVAL_COLLECTION = None  # persisted entries are re-validated on next load
+        _GENERATION = gen
+
+
+def retrieve_many(
+    questions: List[str], k: int = 8, lambda_mult: float = MMR_LAMBDA, Q: Optional[np.ndarray] = None
+) -> List[List[Document]]:
+    """Cached MMR retrieval for several questions; results keep input order.
+
+    Cache misses share one embed request and one vector query. Pass Q (unit
+    query embeddings, one row per question) if the caller already has them.
+    """
+    _sync_index()
+    keys = [_retrieval_key(question, k, lambda_mult) for question in questions]
+    hits: List[Optional[CachedHits]] = [None] * len(questions)
+    with _RETRIEVAL_LOCK:
+        _load_retrieval_cache()
+        for i, key in enumerate(keys):
+            hits[i] = _RETRIEVAL_CACHE.get(key)
+            if hits[i] is not None:
+                _RETRIEVAL_CACHE.move_to_end(key)
+
+    todo = [i for i, hit in enumerate(hits) if hit is None]
+    if todo:
+        V = Q[todo] if Q is not None else _embed_queries([questions[i] for i in todo])
+
+        # New wording: a paraphrase of a recent question skips the HNSW query + MMR
+        with _RETRIEVAL_LOCK:
+            near = _NEAR.setdefault((k, lambda_mult), VectorRing(_NEAR_MAX, NEAR_DUP_SIM))
+            for j, i in enumerate(todo):
+                hits[i] = near.get(V[j])
+
+        search = [j for j, i in enumerate(todo) if hits[i] is None]
+        if search:
+            found = _search_many(V[search], k, lambda_mult)
+            with _RETRIEVAL_LOCK:
+                for j, docs in zip(search, found):
+                    hit = tuple((d.page_content, dict(d.metadata)) for d in docs)
+                    near.put(V[j], hit)
+                    hits[todo[j]] = hit
+
+        with _RETRIEVAL_LOCK:
+            for i in todo:
+                _RETRIEVAL_CACHE[keys[i]] = hits[i]
+            while len(_RETRIEVAL_CACHE) > _RETRIEVAL_CACHE_MAX:
+                _RETRIEVAL_CACHE.popitem(last=False)
+
+    return [[Document(page_content=t, metadata=dict(m)) for t, m in hit] for hit in hits]
+
+
+def retrieve(
+    question: str, k: int = 8, lambda_mult: float = MMR_LAMBDA, q: Optional[np.ndarray] = None
+) -> List[Document]:
+    """MMR retrieval, cached; pass q (unit query embedding) if the caller already has it."""
+    return retrieve_many([question], k, lambda_mult, None if q is None else q[None, :])[0]
+
+
+_ROLE_MSG = {"user": HumanMessage, "assistant": AIMessage}
+
+CANDIDATE_TEMPERATURE = 0.7  # n > 1: candidates must actually differ
+
+
+_LIST_ITEM = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s", re.MULTILINE)
+
+
+def _structure_score(text: str) -> Tuple[int, int]:
+    """(list items, length): most structured candidate first, longest on ties."""
+    return len(_LIST_ITEM.findall(text)), len(text)
+
+
+def ask(
+    agent: str,
+    question: str,
+    k: int = 8,
+    use_cache: bool = True,
+    history: Optional[Sequence[dict]] = None,
+    retrieval_query: Optional[str] = None,
+    n: int = 1,
+) -> dict:
+    """RAG answer for one question.
+
+    history: earlier turns as {"role": "user"|"assistant", "content": ...}, sent as
+    chat messages before the request. retrieval_query: search with this text
+    instead of the question. use_cache=False for one-off prompts (e.g. chat context).
+    n > 1: sample n candidates concurrently over the same prompt; "answer" is the
+    one with the most list items (longest on ties), all of them are in "answers".
+    """
+    _sync_index()
+
+    # A near-identical earlier question is answered without retrieval or generation
+    # (not when earlier turns or a different search text change what the answer is built from)
+    # Exact repeats first; the embedding match only for agents where paraphrases share answers
+    q = None
+    cacheable = use_cache and not history and retrieval_query is None and n == 1 and SETTINGS.semantic_cache
+    if cacheable:
+        collection = str(get_vectorstore()._collection.id)
+        hit = semantic_cache.lookup_exact(collection, agent, k, question)
+        if hit is None and agent in semantic_cache.SIMILAR_AGENTS:
+            q = _embed_query(question)
+            hit = semantic_cache.lookup_similar(collection, agent, k, q)
+        if hit is not None:
+            return hit
+
+    # Cache miss: load the chat model while the question is searched
+    # (not before the lookup: a hit must not make Ollama load or swap models)
+    llm = _chat(agent)
+    _WARMUP_POOL.submit(_warmup, llm)
+
+    if retrieval_query is None:
+        docs = retrieve(question, k, q=q)
+    else:
+        docs = retrieve(retrieval_query, k)
+
+    sys_msg = _SYS_MSGS.get(agent, _SYS_MSGS["thesis"])
+
+    # One join straight into the prompt (no intermediate context string)
+    parts = ["Context:\n"]
+    for d in docs:
+        parts.append(d.page_content)
+        parts.append("\n\n")
+    parts += ("User request:\n", question, "\n")
+    prompt = "".join(parts)
+
+    messages = [sys_msg]
+    for turn in history or ():
+        messages.append(_ROLE_MSG[turn["role"]](content=turn["content"]))
+    messages.append(HumanMessage(content=prompt))
+
+    if n > 1:
+        # Concurrent requests: Ollama decodes them side by side (OLLAMA_NUM_PARALLEL)
+        sampler = llm.model_copy(update={"temperature": CANDIDATE_TEMPERATURE})
+        answers = [r.content for r in sampler.batch([messages] * n)]
+        answer = max(answers, key=_structure_score)
+    else:
+        answers = None
+        answer = llm.invoke(messages).content
+
+    out = {
+        "answer": answer,
         "sources": format_sources(docs),
     }
+    if answers is not None:
+        out["answers"] = answers
+    if cacheable and out["answer"]:
+        semantic_cache.store(collection, agent, k, question, q, out)
+    return out
+
+
+def ask_batch(agents: List[str], questions: List[str], k: int = 8) -> List[dict]:
+    """ask() for several (agent, question) pairs at once; results keep input order.
+
+    All requests are in flight together, so Ollama schedules them side by side
+    (OLLAMA_NUM_PARALLEL slots per model, OLLAMA_MAX_LOADED_MODELS models).
+    """
+    if len(agents) != len(questions):
+        raise ValueError("agents and questions must have the same length")
+    if len(questions) <= 1:
+        return [ask(a, q, k) for a, q in zip(agents, questions)]
+    # One embed request + one Chroma query for the whole batch; each ask() then
+    # finds its question embedding and retrieval already cached
+    retrieve_many(list(questions), k)
+    with ThreadPoolExecutor(max_workers=len(questions), thread_name_prefix="ask-batch") as ex:
+        return list(ex.map(lambda a, q: ask(a, q, k), agents, questions))
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import atexit
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app.config import SETTINGS
+from app.rag.vector_cache import VectorRing, load_pickle, save_pickle
+
+CACHE_FILE = "semantic_cache.pkl"
+SIM_THRESHOLD = 0.97  # cosine between question embeddings that counts as "same question"
+MAX_ENTRIES = 10_000  # per (agent, k); oldest entries are overwritten first
+
+# Agents whose answers may be served for a similar, not identical, question. The reviewer
+# gets pasted paragraphs: a revised one still embeds >= SIM_THRESHOLD but needs a new review.
+SIMILAR_AGENTS = frozenset({"thesis", "python"})
+
+CacheKey = Tuple[str, int]  # (agent, k): k changes the sources an answer used
+
+_LOCK = Lock()
+_EXACT: Dict[CacheKey, "OrderedDict[str, dict]"] = {}  # sha256 of the question text -> answer
+_RINGS: Dict[CacheKey, VectorRing[dict]] = {}
+_COLLECTION: Optional[str] = None  # answers depend on the KB they were retrieved from
+_DIRTY = False
+
+
+def _ensure_loaded(collection: str) -> None:
+    global _COLLECTION
+    if _COLLECTION == collection:
+        return
+    _EXACT.clear()
+    _RINGS.clear()
+    _COLLECTION = collection
+    data = load_pickle(SETTINGS.vectorstore_dir / CACHE_FILE)
+    if data is None or data.get("collection") != collection:
+        return
+    for key, entries in data.get("exact", {}).items():
+        _EXACT[key] = OrderedDict(entries)
+    for key, state in data.get("rings", {}).items():
+        if key[0] in SIMILAR_AGENTS:
+            _RINGS[key] = VectorRing.from_state(MAX_ENTRIES, SIM_THRESHOLD, state)
+
+
+def _text_key(question: str) -> str:
+    return hashlib.sha256(question.encode("utf-8")).hexdigest()
+
+
+def lookup_exact(collection: str, agent: str, k: int, question: str) -> Optional[dict]:
+    """Answer stored for exactly this question text."""
+    key = _text_key(question)
+    with _LOCK:
+        _ensure_loaded(collection)
+        entries = _EXACT.get((agent, k))
+        hit = entries.get(key) if entries is not None else None
+        if hit is not None:
+            entries.move_to_end(key)
+    return dict(hit) if hit is not None else None
+
+
+def lookup_similar(collection: str, agent: str, k: int, q: np.ndarray) -> Optional[dict]:
+    """Answer for the most similar earlier question (unit embedding q); only SIMILAR_AGENTS."""
+    if agent not in SIMILAR_AGENTS:
+        return None
+    with _LOCK:
+        _ensure_loaded(collection)
+        ring = _RINGS.get((agent, k))
+        hit = ring.get(q) if ring is not None else None
+    return dict(hit) if hit is not None else None
+
+
+def store(collection: str, agent: str, k: int, question: str, q: Optional[np.ndarray], out: dict) -> None:
+    """Keep out for exact repeats, and for similar questions if q is given."""
+    global _DIRTY
+    item = dict(out)
+    with _LOCK:
+        _ensure_loaded(collection)
+        entries = _EXACT.setdefault((agent, k), OrderedDict())
+        entries[_text_key(question)] = item
+        while len(entries) > MAX_ENTRIES:
+            entries.popitem(last=False)
+        if q is not None and agent in SIMILAR_AGENTS:
+            _RINGS.setdefault((agent, k), VectorRing(MAX_ENTRIES, SIM_THRESHOLD)).put(q, item)
+        _DIRTY = True
+
+
+@atexit.register
+def _save() -> None:
+    with _LOCK:
+        if not _DIRTY or _COLLECTION is None:
+            return
+        data = {
+            "collection": _COLLECTION,
+            "exact": {key: dict(entries) for key, entries in _EXACT.items() if entries},
+            "rings": {key: r.state() for key, r in _RINGS.items() if r.items},
+        }
+    save_pickle(SETTINGS.vectorstore_dir / CACHE_FILE, data)
@@ -0,0 +1,60 @@
+import uuid
+from typing import Optional, Tuple
+
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+
+from app.config import SETTINGS
+
+# Explicit HNSW graph parameters (only applied when the collection is created)
+COLLECTION_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64,
+}
+
+# Written by build_index() after the last batch is stored. It holds a fresh token per
+# build, so a long-running process can tell (with one stat) that the index was rebuilt.
+READY_FILE = ".ready"
+
+_ready_sig: Optional[Tuple[int, int, int]] = None
+_ready_token: Optional[str] = None
+
+
+def index_generation() -> Optional[str]:
+    """Token of the current finished index, or None while there is none (or mid-rebuild).
+
+    One stat per call; the file is only re-read when it changed.
+    """
+    global _ready_sig, _ready_token
+    path = SETTINGS.vectorstore_dir / READY_FILE
+    try:
+        st = path.stat()
+        sig = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if sig != _ready_sig:
+            _ready_token = path.read_text(encoding="utf-8").strip() or str(sig)
+            _ready_sig = sig
+    except FileNotFoundError:
+        return None
+    return _ready_token
+
+
+def index_exists() -> bool:
+    return index_generation() is not None
+
+
+def write_generation() -> None:
+    # Atomic: readers see either no file or the complete new token
+    path = SETTINGS.vectorstore_dir / READY_FILE
+    tmp = path.with_name(READY_FILE + ".tmp")
+    tmp.write_text(uuid.uuid4().hex, encoding="utf-8")
+    tmp.replace(path)
+
+
+def open_vectorstore(embedding: Embeddings) -> Chroma:
+    return Chroma(
+        persist_directory=str(SETTINGS.vectorstore_dir),
+        embedding_function=embedding,
+        collection_metadata=COLLECTION_METADATA,
+    )
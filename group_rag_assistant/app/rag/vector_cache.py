@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import pickle
+from pathlib import Path
+from typing import Any, Generic, List, Optional, Tuple, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+
+class VectorRing(Generic[T]):
+    """Ring buffer of unit vectors -> items, matched by the best cosine.
+
+    Used for paraphrase lookups: get() returns the item stored under the most
+    similar vector if that cosine reaches the threshold. Oldest entries are
+    overwritten first. Not thread-safe; callers hold their own lock.
+    """
+
+    def __init__(self, size: int, threshold: float):
+        self.size = size
+        self.threshold = threshold
+        self.vecs: Optional[np.ndarray] = None
+        self.items: List[T] = []
+        self.next = 0
+
+    def get(self, q: np.ndarray) -> Optional[T]:
+        if not self.items:
+            return None
+        sims = self.vecs[: len(self.items)] @ q
+        i = int(np.argmax(sims))
+        return self.items[i] if sims[i] >= self.threshold else None
+
+    def put(self, q: np.ndarray, item: T) -> None:
+        if self.vecs is None:
+            self.vecs = np.empty((self.size, q.shape[0]), dtype=np.float32)
+        self.vecs[self.next] = q
+        if len(self.items) < self.size:
+            self.items.append(item)
+        else:
+            self.items[self.next] = item
+        self.next = (self.next + 1) % self.size
+
+    def state(self) -> Tuple[Optional[np.ndarray], List[T], int]:
+        """Picklable copy of the filled part, for from_state()."""
+        vecs = None if self.vecs is None else self.vecs[: len(self.items)].copy()
+        return vecs, list(self.items), self.next
+
+    @classmethod
+    def from_state(cls, size: int, threshold: float, state: Tuple[Any, List[T], int]) -> "VectorRing[T]":
+        vecs, items, nxt = state
+        ring = cls(size, threshold)
+        items = list(items)[:size]
+        if items:
+            ring.vecs = np.empty((size, vecs.shape[1]), dtype=np.float32)
+            ring.vecs[: len(items)] = vecs[: len(items)]
+            ring.items = items
+            ring.next = nxt % size
+        return ring
+
+
+def load_pickle(path: Path) -> Optional[dict]:
+    """Contents of a cache file written by save_pickle(), or None if missing/unreadable."""
+    try:
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+    except Exception:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def save_pickle(path: Path, data: dict) -> None:
+    """Write via a .tmp file and rename, so a crash never leaves a half-written cache."""
+    tmp = path.with_suffix(".tmp")
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp.replace(path)
+    except OSError:
+        pass
@@ -1,19 +1,24 @@
 from __future__ import annotations
 
 import asyncio
-import json
-from collections import deque
+import hashlib
+import ipaddress
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
 from pathlib import Path
-from threading import Lock
-from typing import Deque, Dict, Optional, TypedDict, Iterable
+from typing import Deque, Dict, Literal, NamedTuple, Optional, Set, Tuple
 
-from fastapi import FastAPI, HTTPException
+import orjson
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
 from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
-from app.config import SETTINGS
 from app.rag.query import ask
+from app.rag.store import index_exists
 
 app = FastAPI(title="Group RAG Assistant", version="0.4")
 
@@ -30,19 +35,32 @@ app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 # -----------------------------
 DEFAULT_CONTEXT_TURNS = 10   # remember last 10 turns per session
 _MAX_TURNS_PER_SESSION = 80  # hard cap
+MAX_SESSIONS = 10_000        # least recently used sessions are dropped beyond this
 
 
-class Turn(TypedDict):
+class Turn(NamedTuple):
     q: str
     a: str
 
 
-_MEM_LOCK = Lock()
-_SESSION_TURNS: Dict[str, Deque[Turn]] = {}
+_SESSION_TURNS: "OrderedDict[str, Deque[Turn]]" = OrderedDict()
+_CTX_CACHE: Dict[str, Tuple[int, str]] = {}  # session_id -> (depth, rendered context)
+
+
+@app.on_event("startup")
+async def _check_loop() -> None:
+    # Not fatal (e.g. Windows has no uvloop), but streaming is slower without it
+    if type(asyncio.get_running_loop()).__module__.split(".")[0] != "uvloop":
+        logging.getLogger("uvicorn.error").warning(
+            "Running on the default asyncio loop; start with `python main.py serve` "
+            "(pip install 'uvicorn[standard]') to use uvloop + httptools."
+        )
 
 
 def index_ready() -> bool:
-    return SETTINGS.vectorstore_dir.exists() and any(SETTINGS.vectorstore_dir.iterdir())
+    # One stat per request: goes False while `python main.py ingest` rebuilds,
+    # True again (with a new generation, picked up by ask()) once it is done
+    return index_exists()
 
 
 def _clamp_int(x: int, lo: int, hi: int) -> int:
@@ -50,10 +68,22 @@ def _clamp_int(x: int, lo: int, hi: int) -> int:
 
 
 def _get_history(session_id: str) -> Deque[Turn]:
-    with _MEM_LOCK:
-        if session_id not in _SESSION_TURNS:
-            _SESSION_TURNS[session_id] = deque(maxlen=_MAX_TURNS_PER_SESSION)
-        return _SESSION_TURNS[session_id]
+    # No global lock: each step below is a single C-level dict operation
+    hist = _SESSION_TURNS.get(session_id)
+    if hist is None:
+        hist = _SESSION_TURNS.setdefault(session_id, deque(maxlen=_MAX_TURNS_PER_SESSION))
+        while len(_SESSION_TURNS) > MAX_SESSIONS:
+            try:
+                old_id, _ = _SESSION_TURNS.popitem(last=False)
+            except KeyError:
+                break
+            _CTX_CACHE.pop(old_id, None)
+    else:
+        try:
+            _SESSION_TURNS.move_to_end(session_id)
+        except KeyError:
+            pass  # evicted concurrently; this request keeps its deque
+    return hist
 
 
 def _build_context(session_id: str, depth: int) -> str:
@@ -61,45 +91,118 @@ def _build_context(session_id: str, depth: int) -> str:
     if depth <= 0:
         return ""
 
+    cached = _CTX_CACHE.get(session_id)
+    if cached is not None and cached[0] == depth:
+        return cached[1]
+
     hist = _get_history(session_id)
     if not hist:
         return ""
 
-    turns = list(hist)[-depth:]
-    lines = []
-    for t in turns:
-        lines.append(f"User: {t['q']}\nAssistant: {t['a']}")
-    return "\n\n".join(lines)
+    # Walk only the tail instead of copying the whole deque into a list
+    n = len(hist)
+    turns = islice(hist, max(0, n - depth), n)
+    # Formatting happens only on a cache miss (once per new turn), so turns store q/a only
+    rendered = "\n\n".join(f"User: {t.q}\nAssistant: {t.a}" for t in turns)
+    _CTX_CACHE[session_id] = (depth, rendered)
+    return rendered
 
 
 def _store_turn(session_id: str, q: str, a: str) -> None:
-    hist = _get_history(session_id)
-    with _MEM_LOCK:
-        hist.append({"q": q, "a": a})
+    # deque.append (incl. maxlen eviction) is a single atomic operation
+    _get_history(session_id).append(Turn(q, a))
+    # Invalidate after appending, so the next _build_context sees this turn
+    _CTX_CACHE.pop(session_id, None)
+
+
+_CTX_TMPL = (
+    "You are continuing an ongoing conversation. Use the context below to stay consistent.\n\n"
+    "=== Conversation context (most recent last) ===\n"
+    "{ctx}\n"
+    "=== End context ===\n\n"
+    "User: {q}"
+)
+
+
+def _prompt_with_context(session_id: Optional[str], question: str) -> Tuple[str, bool]:
+    """(prompt for the model, whether it includes earlier turns of the session)."""
+    if not session_id:
+        return question, False
+    ctx = _build_context(session_id, DEFAULT_CONTEXT_TURNS)
+    if not ctx:
+        return question, False
+    return _CTX_TMPL.format(ctx=ctx, q=question), True
+
+
+# -----------------------------
+# ask() runs on its own pool
+# -----------------------------
+ASK_POOL_SIZE = 16  # hard ceiling for the admission limit below
+ASK_POOL = ThreadPoolExecutor(max_workers=ASK_POOL_SIZE, thread_name_prefix="ask")
+
+# Admission: at most _ASK_MAX ask() calls run at once (resizable at runtime)
+_ASK_COND = asyncio.Condition(asyncio.Lock())
+_ASK_INFLIGHT = 0
+_ASK_MAX = 4
+
+
+_RELEASES: Set["asyncio.Task"] = set()  # keeps release tasks referenced until they ran
+
+
+async def _release_slot() -> None:
+    global _ASK_INFLIGHT
+    async with _ASK_COND:
+        _ASK_INFLIGHT -= 1
+        _ASK_COND.notify(1)
+
+
+def _on_ask_done(fut: "asyncio.Future") -> None:
+    # Runs on the loop when the ask() thread has really finished
+    if not fut.cancelled():
+        fut.exception()  # mark as retrieved; a disconnected client never awaits it
+    task = asyncio.get_running_loop().create_task(_release_slot())
+    _RELEASES.add(task)
+    task.add_done_callback(_RELEASES.discard)
+
+
+async def _run_ask(agent: str, question: str, k: int, use_cache: bool = True) -> dict:
+    # Dedicated pool: long LLM calls never starve Starlette's default threadpool
+    global _ASK_INFLIGHT
+    async with _ASK_COND:
+        await _ASK_COND.wait_for(lambda: _ASK_INFLIGHT < _ASK_MAX)
+        _ASK_INFLIGHT += 1
+    loop = asyncio.get_running_loop()
+    try:
+        fut = loop.run_in_executor(ASK_POOL, partial(ask, agent, question, k, use_cache=use_cache))
+    except BaseException:
+        await _release_slot()
+        raise
+    # The slot belongs to the thread, not to this request: on a client disconnect the
+    # generation keeps running, so the slot is only released once it is done
+    fut.add_done_callback(_on_ask_done)
+    return await asyncio.shield(fut)
 
 
-def _chunk_text(s: str, size: int = 120) -> Iterable[str]:
-    if not s:
-        return []
-    return (s[i: i + size] for i in range(0, len(s), size))
+def _frame(obj: dict) -> bytes:
+    # One NDJSON line, already UTF-8 bytes (StreamingResponse sends them as-is)
+    return orjson.dumps(obj) + b"\n"
+
+
+class CapacityRequest(BaseModel):
+    max_inflight: int
 
 
 class AskRequest(BaseModel):
-    agent: str  # thesis/python/reviewer (intern)
+    agent: Literal["thesis", "python", "reviewer"]  # internal names; checked by Pydantic
     question: str
     k: int = 4
     session_id: Optional[str] = None
 
 
-@app.get("/favicon.ico")
-def favicon():
-    return Response(status_code=204)
-
-
-@app.get("/", response_class=HTMLResponse)
-def home():
-    return HTMLResponse(
-        r"""
+# -----------------------------
+# Landing page (encoded once at import)
+# -----------------------------
+_HOME_HTML = r"""
 <!doctype html>
 <html lang="en">
 <head>
@@ -629,100 +732,91 @@ function setStatus(s){
   if(status) status.textContent = s || "";
 }
 
+const ESCAPE_RE = /[&<>"']/g;
+const ESCAPE_MAP = {"&":"&amp;", "<":"&lt;", ">":"&gt;", '"':"&quot;", "'":"&#039;"};
+
 function escapeHtml(s){
-  return (s || "")
-    .replaceAll("&","&amp;")
-    .replaceAll("<","&lt;")
-    .replaceAll(">","&gt;")
-    .replaceAll('"',"&quot;")
-    .replaceAll("'","&#039;");
+  return (s || "").replace(ESCAPE_RE, c => ESCAPE_MAP[c]);
 }
 
-/* Minimal safe Markdown renderer */
-function mdToHtml(md){
-  const text = md || "";
-  const parts = [];
-  let i = 0;
-
-  while(i < text.length){
-    const start = text.indexOf("```", i);
-    if(start === -1){
-      parts.push({type:"text", value: text.slice(i)});
-      break;
-    }
-    if(start > i) parts.push({type:"text", value: text.slice(i, start)});
-
-    const langEnd = text.indexOf("\n", start + 3);
-    if(langEnd === -1){
-      parts.push({type:"text", value: text.slice(start)});
-      break;
-    }
-    const lang = text.slice(start + 3, langEnd).trim();
-    const end = text.indexOf("```", langEnd + 1);
-    if(end === -1){
-      parts.push({type:"text", value: text.slice(start)});
-      break;
-    }
-    const code = text.slice(langEnd + 1, end);
-    parts.push({type:"code", lang: lang || "", value: code});
-    i = end + 3;
-  }
+/* Minimal safe Markdown renderer (single pass over fenced code blocks) */
+const FENCE_RE = /```([^\n]*)\n([\s\S]*?)```/g;
+const INLINE_CODE_RE = /`([^`]+)`/g;
+const BOLD_RE = /\*\*([^*]+)\*\*/g;
+const LINE_RE = /\r?\n/;
+const TRAILING_WS_RE = /\s+$/;
+
+function inlineFormat(s){
+  return escapeHtml(s)
+    .replace(INLINE_CODE_RE, (m, g1) => `<code class="inline">${g1}</code>`)
+    .replace(BOLD_RE, (m, g1) => `<strong>${g1}</strong>`);
+}
 
-  const htmlParts = [];
+function renderTextBlock(block){
+  const out = [];
+  let inList = false;
 
-  function inlineFormat(s){
-    let x = escapeHtml(s);
-    x = x.replace(/`([^`]+)`/g, (m, g1) => `<code class="inline">${g1}</code>`);
-    x = x.replace(/\*\*([^*]+)\*\*/g, (m, g1) => `<strong>${g1}</strong>`);
-    return x;
+  function closeList(){
+    if(inList){ out.push("</ul>"); inList = false; }
   }
 
-  function renderTextBlock(block){
-    const lines = block.split(/\r?\n/);
-    let html = "";
-    let inList = false;
-
-    function closeList(){
-      if(inList){ html += "</ul>"; inList = false; }
+  for(const rawLine of block.split(LINE_RE)){
+    const line = rawLine.replace(TRAILING_WS_RE, "");
+    if(!line.trim()){
+      closeList();
+      continue;
     }
 
-    for(const rawLine of lines){
-      const line = rawLine.replace(/\s+$/,"");
-      if(!line.trim()){
-        closeList();
-        continue;
-      }
-
-      if(line.startsWith("### ")){ closeList(); html += `<h3>${inlineFormat(line.slice(4))}</h3>`; continue; }
-      if(line.startsWith("## ")){  closeList(); html += `<h2>${inlineFormat(line.slice(3))}</h2>`; continue; }
-      if(line.startsWith("# ")){   closeList(); html += `<h1>${inlineFormat(line.slice(2))}</h1>`; continue; }
-
-      if(line.startsWith("- ") || line.startsWith("* ")){
-        if(!inList){ html += "<ul>"; inList = true; }
-        html += `<li>${inlineFormat(line.slice(2))}</li>`;
-        continue;
-      }
+    if(line.startsWith("### ")){ closeList(); out.push(`<h3>${inlineFormat(line.slice(4))}</h3>`); continue; }
+    if(line.startsWith("## ")){  closeList(); out.push(`<h2>${inlineFormat(line.slice(3))}</h2>`); continue; }
+    if(line.startsWith("# ")){   closeList(); out.push(`<h1>${inlineFormat(line.slice(2))}</h1>`); continue; }
 
-      closeList();
-      html += `<p>${inlineFormat(line)}</p>`;
+    if(line.startsWith("- ") || line.startsWith("* ")){
+      if(!inList){ out.push("<ul>"); inList = true; }
+      out.push(`<li>${inlineFormat(line.slice(2))}</li>`);
+      continue;
     }
 
     closeList();
-    return html;
+    out.push(`<p>${inlineFormat(line)}</p>`);
   }
 
-  for(const p of parts){
-    if(p.type === "code"){
-      const langClass = p.lang ? `language-${escapeHtml(p.lang)}` : "";
-      htmlParts.push(
-        `<pre class="code"><code class="${langClass}">${escapeHtml(p.value)}</code></pre>`
-      );
-    }else{
-      htmlParts.push(renderTextBlock(p.value));
-    }
+  closeList();
+  return out.join("");
+}
+
+function mdToHtml(md){
+  const text = md || "";
+  const out = [];
+  let last = 0;
+  let m;
+
+  // Text between fences is rendered as blocks; an unterminated fence stays text
+  FENCE_RE.lastIndex = 0;
+  while((m = FENCE_RE.exec(text)) !== null){
+    if(m.index > last) out.push(renderTextBlock(text.slice(last, m.index)));
+    const lang = m[1].trim();
+    const langClass = lang ? `language-${escapeHtml(lang)}` : "";
+    out.push(`<pre class="code"><code class="${langClass}">${escapeHtml(m[2])}</code></pre>`);
+    last = FENCE_RE.lastIndex;
   }
+  if(last < text.length) out.push(renderTextBlock(text.slice(last)));
 
-  return `<div class="md">${htmlParts.join("")}</div>`;
+  return `<div class="md">${out.join("")}</div>`;
+}
+
+/* End of the last blank line (searching from `from`) that is outside a code
+   fence; `from` must itself be outside a fence */
+function stableSplit(text, from){
+  let split = from, fences = 0, i = from;
+  while(true){
+    const b = text.indexOf("\n\n", i);
+    if(b < 0) return split;
+    const f = text.indexOf("```", i);
+    if(f >= 0 && f < b){ fences++; i = f + 3; continue; }
+    if(fences % 2 === 0) split = b + 2;
+    i = b + 2;
+  }
 }
 
 function renderAssistant(agentName, rawText){
@@ -812,6 +906,19 @@ async function copyLastAssistant(){
   setStatus(ok ? "Copied last assistant message." : "Copy failed (browser permission).");
 }
 
+/* NDJSON framing on raw bytes: only complete lines are ever decoded,
+   so a long answer is not re-concatenated as a string on every chunk */
+const NEWLINE = 0x0A;
+const UTF8 = new TextDecoder("utf-8");
+
+function joinBytes(parts, total){
+  if(parts.length === 1) return parts[0];
+  const out = new Uint8Array(total);
+  let off = 0;
+  for(const p of parts){ out.set(p, off); off += p.length; }
+  return out;
+}
+
 /* Streaming via NDJSON fetch */
 async function send(){
   const ta = document.getElementById("q");
@@ -832,6 +939,53 @@ async function send(){
     ta.focus();
   }
 
+  const mode = agent;  // the agent may be switched while this answer streams
+  let rawAnswer = "";
+
+  // Incremental render: only text that is new since the last frame is touched
+  let rendered = 0;                    // chars of rawAnswer already fixed in the DOM
+  let codeText = null;                 // python mode: append-only text node
+  let stableEl = null, tailEl = null;  // markdown mode: finished blocks / live tail
+  const renderDelta = () => {
+    if(mode === "python"){
+      if(!codeText){
+        assistantBubble.innerHTML = `<pre class="code"><code></code></pre>`;
+        codeText = document.createTextNode("");
+        assistantBubble.querySelector("code").appendChild(codeText);
+      }
+      codeText.appendData(rawAnswer.slice(rendered));
+      rendered = rawAnswer.length;
+      return;
+    }
+    if(!stableEl){
+      assistantBubble.innerHTML = "<div></div><div></div>";
+      stableEl = assistantBubble.firstChild;
+      tailEl = assistantBubble.lastChild;
+    }
+    // Blocks before the last blank line outside a fence cannot change any more
+    const split = stableSplit(rawAnswer, rendered);
+    if(split > rendered){
+      stableEl.insertAdjacentHTML("beforeend", safeRenderAssistant(mode, rawAnswer.slice(rendered, split)));
+      rendered = split;
+    }
+    tailEl.innerHTML = safeRenderAssistant(mode, rawAnswer.slice(rendered));
+  };
+
+  // Coalesce re-renders to at most one per animation frame
+  let renderFrame = 0;
+  const scheduleRender = () => {
+    if(renderFrame) return;
+    renderFrame = requestAnimationFrame(() => {
+      renderFrame = 0;
+      renderDelta();
+      // nur scrollen, wenn User ohnehin unten ist
+      maybeScrollToBottom(false);
+    });
+  };
+  const cancelRender = () => {
+    if(renderFrame){ cancelAnimationFrame(renderFrame); renderFrame = 0; }
+  };
+
   try{
     const res = await fetch("/api/ask_stream", {
       method: "POST",
@@ -853,22 +1007,34 @@ async function send(){
     }
 
     const reader = res.body.getReader();
-    const decoder = new TextDecoder("utf-8");
 
-    let buffer = "";
-    let rawAnswer = "";
+    // Bytes of the current, still incomplete line (views into received chunks)
+    let parts = [];
+    let partsLen = 0;
     let sourcesRaw = "";
-    let lastRenderAt = 0;
 
     while(true){
       const {value, done} = await reader.read();
       if(done) break;
-      buffer += decoder.decode(value, {stream:true});
 
-      let idx;
-      while((idx = buffer.indexOf("\n")) >= 0){
-        const line = buffer.slice(0, idx).trim();
-        buffer = buffer.slice(idx + 1);
+      const lines = [];
+      let start = 0;
+      let nl;
+      while((nl = value.indexOf(NEWLINE, start)) >= 0){
+        parts.push(value.subarray(start, nl));
+        partsLen += nl - start;
+        lines.push(UTF8.decode(joinBytes(parts, partsLen)));
+        parts = [];
+        partsLen = 0;
+        start = nl + 1;
+      }
+      if(start < value.length){
+        parts.push(value.subarray(start));
+        partsLen += value.length - start;
+      }
+
+      for(const rawLine of lines){
+        const line = rawLine.trim();
         if(!line) continue;
 
         let msg;
@@ -876,16 +1042,12 @@ async function send(){
 
         if(msg.type === "delta"){
           rawAnswer += (msg.text || "");
-          const now = Date.now();
-          if(now - lastRenderAt > 45){
-            assistantBubble.innerHTML = safeRenderAssistant(agent, rawAnswer);
-            // nur scrollen, wenn User ohnehin unten ist
-            maybeScrollToBottom(false);
-            lastRenderAt = now;
-          }
+          scheduleRender();
         }else if(msg.type === "done"){
+          // final render below; a pending frame would drop the sources box
+          cancelRender();
           sourcesRaw = msg.sources || "";
-          assistantBubble.innerHTML = safeRenderAssistant(agent, rawAnswer);
+          assistantBubble.innerHTML = safeRenderAssistant(mode, rawAnswer);
 
           const srcHtml = sourcesToHtml(sourcesRaw);
           if(srcHtml){
@@ -909,6 +1071,7 @@ async function send(){
           // auch hier: nur wenn unten
           maybeScrollToBottom(false);
         }else if(msg.type === "error"){
+          cancelRender();
           assistantBubble.innerHTML = `<div class="md"><p><strong>Error:</strong> ${escapeHtml(msg.error || "unknown")}</p></div>`;
           setStatus("Error.");
           maybeScrollToBottom(false);
@@ -916,6 +1079,7 @@ async function send(){
       }
     }
   }catch(e){
+    cancelRender();
     assistantBubble.innerHTML = `<div class="md"><p><strong>Error:</strong> ${escapeHtml(String(e))}</p></div>`;
     setStatus("Error.");
     maybeScrollToBottom(false);
@@ -937,16 +1101,30 @@ async function send(){
 </body>
 </html>
 """
-    )
+
+_HOME_BYTES = _HOME_HTML.encode("utf-8")
+_HOME_ETAG = '"' + hashlib.sha1(_HOME_BYTES).hexdigest()[:16] + '"'
+# no-cache = "revalidate every time": reloads cost a 304, never stale HTML after an upgrade
+_HOME_CACHE = {"etag": _HOME_ETAG, "cache-control": "no-cache"}
+_HOME_HEADERS = {**_HOME_CACHE, "content-length": str(len(_HOME_BYTES))}
+
+
+@app.get("/favicon.ico")
+def favicon():
+    return Response(status_code=204)
+
+
+@app.get("/", response_class=HTMLResponse)
+def home(if_none_match: Optional[str] = Header(default=None)):
+    if if_none_match and _HOME_ETAG in (t.strip().removeprefix("W/") for t in if_none_match.split(",")):
+        return Response(status_code=304, headers=_HOME_CACHE)
+    return Response(content=_HOME_BYTES, media_type="text/html; charset=utf-8", headers=_HOME_HEADERS)
 
 
 @app.post("/api/ask")
-def api_ask(req: AskRequest):
+async def api_ask(req: AskRequest):
     """Non-stream fallback (not used by UI, but handy for debugging)."""
     try:
-        if req.agent not in {"thesis", "python", "reviewer"}:
-            raise HTTPException(status_code=400, detail="agent must be thesis/python/reviewer")
-
         if not index_ready():
             return JSONResponse(
                 {
@@ -955,19 +1133,12 @@ def api_ask(req: AskRequest):
                 }
             )
 
-        question_for_model = req.question
-        if req.session_id:
-            ctx = _build_context(req.session_id, DEFAULT_CONTEXT_TURNS)
-            if ctx:
-                question_for_model = (
-                    "You are continuing an ongoing conversation. Use the context below to stay consistent.\n\n"
-                    "=== Conversation context (most recent last) ===\n"
-                    f"{ctx}\n"
-                    "=== End context ===\n\n"
-                    f"User: {req.question}"
-                )
-
-        out = ask(req.agent, question_for_model, k=req.k)
+        question_for_model, has_context = _prompt_with_context(req.session_id, req.question)
+        # Answers that depend on chat context are never served to other conversations
+        cacheable = not has_context
+
+        # Only the LLM call leaves the event loop; the rest is microseconds of dict work
+        out = await _run_ask(req.agent, question_for_model, req.k, use_cache=cacheable)
 
         if req.session_id:
             _store_turn(req.session_id, req.question, out.get("answer", ""))
@@ -980,39 +1151,27 @@ def api_ask(req: AskRequest):
 @app.post("/api/ask_stream")
 async def api_ask_stream(req: AskRequest):
     """
-    Streaming effect via NDJSON.
-    If your ask() supports true token streaming, replace chunking accordingly.
+    NDJSON stream: one "delta" frame with the full answer, then "done" (or "error").
+    If your ask() supports true token streaming, emit one delta per token instead.
     """
-    if req.agent not in {"thesis", "python", "reviewer"}:
-        raise HTTPException(status_code=400, detail="agent must be thesis/python/reviewer")
-
     if not index_ready():
         async def err_gen():
-            yield json.dumps(
+            yield _frame(
                 {
                     "type": "error",
                     "error": "Vector index not found. Run: python main.py ingest (from project root), then reload the page."
-                },
-                ensure_ascii=False,
-            ) + "\n"
+                }
+            )
 
         return StreamingResponse(err_gen(), media_type="application/x-ndjson")
 
-    question_for_model = req.question
-    if req.session_id:
-        ctx = _build_context(req.session_id, DEFAULT_CONTEXT_TURNS)
-        if ctx:
-            question_for_model = (
-                "You are continuing an ongoing conversation. Use the context below to stay consistent.\n\n"
-                "=== Conversation context (most recent last) ===\n"
-                f"{ctx}\n"
-                "=== End context ===\n\n"
-                f"User: {req.question}"
-            )
+    question_for_model, has_context = _prompt_with_context(req.session_id, req.question)
+    # Answers that depend on chat context are never served to other conversations
+    cacheable = not has_context
 
     async def gen():
         try:
-            out = await asyncio.to_thread(ask, req.agent, question_for_model, req.k)
+            out = await _run_ask(req.agent, question_for_model, req.k, use_cache=cacheable)
 
             answer = out.get("answer", "") or ""
             sources = out.get("sources", "") or ""
@@ -1020,12 +1179,40 @@ async def api_ask_stream(req: AskRequest):
             if req.session_id:
                 _store_turn(req.session_id, req.question, answer)
 
-            for ch in _chunk_text(answer, size=140):
-                yield json.dumps({"type": "delta", "text": ch}, ensure_ascii=False) + "\n"
-                await asyncio.sleep(0)
+            # ask() returns the full answer, so it goes out as one frame
+            if answer:
+                yield _frame({"type": "delta", "text": answer})
 
-            yield json.dumps({"type": "done", "sources": sources}, ensure_ascii=False) + "\n"
+            yield _frame({"type": "done", "sources": sources})
         except Exception as e:
-            yield json.dumps({"type": "error", "error": str(e)}, ensure_ascii=False) + "\n"
+            yield _frame({"type": "error", "error": str(e)})
 
     return StreamingResponse(gen(), media_type="application/x-ndjson")
+
+
+def _require_loopback(request: Request) -> None:
+    """Admin endpoints: only for clients on this machine (serve --host 0.0.0.0 exposes the rest)."""
+    host = request.client.host if request.client else ""
+    try:
+        addr = ipaddress.ip_address(host)
+        local = addr.is_loopback or bool(getattr(addr, "ipv4_mapped", None) and addr.ipv4_mapped.is_loopback)
+    except ValueError:
+        local = False
+    if not local:
+        raise HTTPException(status_code=403, detail="admin endpoints are only served to localhost")
+
+
+@app.get("/api/admin/ask_capacity", dependencies=[Depends(_require_loopback)])
+def get_ask_capacity():
+    return {"max_inflight": _ASK_MAX, "inflight": _ASK_INFLIGHT, "pool_size": ASK_POOL_SIZE}
+
+
+@app.post("/api/admin/ask_capacity", dependencies=[Depends(_require_loopback)])
+async def set_ask_capacity(req: CapacityRequest):
+    """Resize the ask() admission limit (1..ASK_POOL_SIZE) without a restart."""
+    global _ASK_MAX
+    async with _ASK_COND:
+        _ASK_MAX = _clamp_int(req.max_inflight, 1, ASK_POOL_SIZE)
+        # Waiters re-check the predicate; on a decrease they simply keep waiting
+        _ASK_COND.notify_all()
+    return {"max_inflight": _ASK_MAX, "inflight": _ASK_INFLIGHT, "pool_size": ASK_POOL_SIZE}
@@ -1,40 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from app.config import SETTINGS
-from app.rag.ingest import build_index
-from app.rag.query import ask
+from app.rag.ingest import ensure_index
+from app.rag.query import ask, ask_batch
 
 REPORT_DIR = Path("reports")
 REPORT_DIR.mkdir(exist_ok=True)
 
-def ensure_index():
-    if not SETTINGS.vectorstore_dir.exists() or not any(SETTINGS.vectorstore_dir.iterdir()):
-        build_index()
+
+# Fixed prompts, built once at import
+# 1) Thesis agent: schreibt kurzen Methods-Absatz aus KB
+Q1 = "Write a short Methods-style paragraph for an electrochemistry data analysis workflow. Use the retrieved context. No invented citations."
+
+# 2) Python agent: liefert Analyseplan + plotting steps (ohne echte Daten)
+Q2 = (
+    "Propose a robust Python data analysis skeleton for battery cycling data (capacity vs cycle). "
+    "Include: loading, cleaning, feature extraction, and matplotlib plotting. "
+    "Load only the needed columns with explicit compact dtypes (pd.read_csv usecols=, dtype=, engine='pyarrow'); "
+    "read cycle as nullable 'Int32' (a blank cell must not fail the read), then dropna(subset=['cycle']) and cast to int32. "
+    "Compute per-cycle features in a single groupby aggregation; no dropna on capacity (mean skips NaN). "
+    "Also add extract_features_fast(data) computing the same per-cycle mean with NumPy: contiguous "
+    "int32/float32 arrays, NaN capacities masked out, np.bincount(cycle, weights=capacity) / np.bincount(cycle), "
+    "returning only cycles that occur; main() uses it. "
+    "Return code only."
+)
+
+# 3) Reviewer: the paragraph arrives as the previous assistant turn, not pasted into the request
+Q3 = (
+    "Review the Methods paragraph from the previous answer for scientific tone, missing info, "
+    "and potential hallucinations. Return bullet points only."
+)
+
+
+REVIEW_CANDIDATES = 4  # reviews sampled; the most structured one is kept
+
+
+def _write_report(name: str, text: str) -> None:
+    path = REPORT_DIR / name
+    data = (text.strip() + "\n").encode("utf-8")
+    # Unchanged output: leave the file (and its mtime) alone for editors/diff tools
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return
+    except FileNotFoundError:
+        pass
+    # One encode + one unbuffered write; no TextIOWrapper around the file
+    path.write_bytes(data)
+
 
 def run_demo():
     ensure_index()
 
-    # 1) Thesis agent: schreibt kurzen Methods-Absatz aus KB
-    q1 = "Write a short Methods-style paragraph for an electrochemistry data analysis workflow. Use the retrieved context. No invented citations."
-    out1 = ask("thesis", q1)
-    (REPORT_DIR / "methods.md").write_text(out1["answer"].strip() + "\n", encoding="utf-8")
-
-    # 2) Python agent: liefert Analyseplan + plotting steps (ohne echte Daten)
-    q2 = (
-        "Propose a robust Python data analysis skeleton for battery cycling data (capacity vs cycle). "
-        "Include: loading, cleaning, feature extraction, and matplotlib plotting. "
-        "Return code only."
-    )
-    out2 = ask("python", q2)
-    (REPORT_DIR / "analysis_skeleton.py").write_text(out2["answer"].strip() + "\n", encoding="utf-8")
-
-    # 3) Optional: Reviewer (hier als “thesis” missbraucht, bis du ein extra reviewer-Modell baust)
-    q3 = (
-        "Review the following Methods paragraph for scientific tone, missing info, and potential hallucinations. "
-        "Return bullet points only.\n\n"
-        + out1["answer"]
-    )
-    out3 = ask("reviewer", q3)
-    (REPORT_DIR / "review.txt").write_text(out3["answer"].strip() + "\n", encoding="utf-8")
+    # q1 and q2 are independent: one batch, both generated at the same time
+    out1, out2 = ask_batch(["thesis", "python"], [Q1, Q2])
+
+    # Files 1+2 are written in the background while the reviewer generates
+    with ThreadPoolExecutor(max_workers=3) as ex:
+        writes = [
+            ex.submit(_write_report, "methods.md", out1["answer"]),
+            ex.submit(_write_report, "analysis_skeleton.py", out2["answer"]),
+        ]
+
+        # 3) Optional: Reviewer (hier als “thesis” missbraucht, bis du ein extra reviewer-Modell baust)
+        # Same retrieval as q1 (a cache hit), so the check runs against the paragraph's own sources
+        history = [{"role": "user", "content": Q1}, {"role": "assistant", "content": out1["answer"]}]
+        out3 = ask("reviewer", Q3, history=history, retrieval_query=Q1, n=REVIEW_CANDIDATES)
+        writes.append(ex.submit(_write_report, "review.txt", out3["answer"]))
+        for w in writes:
+            w.result()  # re-raise write errors
 
     print("OK: wrote reports/methods.md, reports/analysis_skeleton.py, reports/review.txt")
 
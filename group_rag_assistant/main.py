@@ -1,9 +1,7 @@
 import sys
 
-from app.config import SETTINGS
-from app.rag.ingest import build_index
-from app.rag.query import ask
-from app.workflows.demo_agent import run_demo
+# Subcommand imports are local: the RAG stack (langchain, chromadb, ...) takes
+# seconds to import and is not needed for usage, serve, or a question the server answers
 
 
 USAGE = """
@@ -11,12 +9,53 @@ python main.py ingest
 python main.py thesis "question"
 python main.py python "question"
 python main.py demo
+python main.py serve [--host 127.0.0.1] [--port 8000]
+
+Questions go to the running server (SETTINGS.server_url) if there is one.
 """
 
 
-def ensure_index() -> None:
-    if not SETTINGS.vectorstore_dir.exists() or not any(SETTINGS.vectorstore_dir.iterdir()):
-        build_index()
+def _has(module: str) -> bool:
+    import importlib.util
+    return importlib.util.find_spec(module) is not None
+
+
+def _flag_value(args, flag: str):
+    """Value after flag; None if the flag is absent, "" if it has no value."""
+    if flag not in args:
+        return None
+    i = args.index(flag) + 1
+    return args[i] if i < len(args) and not args[i].startswith("--") else ""
+
+
+def serve(args) -> None:
+    import urllib.parse
+
+    from app.config import SETTINGS
+
+    # Default to the address the CLI client talks to, so both sides agree
+    url = urllib.parse.urlsplit(SETTINGS.server_url)
+    host, port = url.hostname or "127.0.0.1", url.port or 8000
+    host_arg, port_arg = _flag_value(args, "--host"), _flag_value(args, "--port")
+    if host_arg == "" or (port_arg is not None and not (port_arg.isdigit() and 0 < int(port_arg) < 65536)):
+        print("Invalid --host/--port.\n", USAGE)
+        return
+    if host_arg is not None:
+        host = host_arg
+    if port_arg is not None:
+        port = int(port_arg)
+
+    import uvicorn
+
+    # uvloop + httptools (both in uvicorn[standard]) make the small NDJSON frames cheaper.
+    # One worker only: chat memory lives in process memory.
+    uvicorn.run(
+        "app.server:app",
+        host=host,
+        port=port,
+        loop="uvloop" if _has("uvloop") else "auto",
+        http="httptools" if _has("httptools") else "auto",
+    )
 
 
 def main():
@@ -27,11 +66,17 @@ def main():
     cmd = sys.argv[1].lower().strip()
 
     if cmd == "ingest":
+        from app.rag.ingest import build_index
         build_index()
         return
 
+    if cmd == "serve":
+        serve(sys.argv[2:])
+        return
+
     if cmd == "demo":
-        # demo_agent already calls ensure_index internally, but no harm either way
+        # demo_agent calls ensure_index itself
+        from app.workflows.demo_agent import run_demo
         run_demo()
         return
 
@@ -41,11 +86,21 @@ def main():
             print("Missing question.\n", USAGE)
             return
 
-        ensure_index()
-        out = ask(cmd, q)
-        print(out["answer"])
+        # Prefer the running server (warm models, index and caches); else answer in-process
+        from app.client import ask_remote
+        out = ask_remote(cmd, q)
+        if out is None:
+            from app.rag.ingest import ensure_index
+            from app.rag.query import ask
+            ensure_index()
+            out = ask(cmd, q)
+        # Same bytes print() produced, encoded once and written in one call
+        text = out["answer"] + "\n"
         if out.get("sources"):
-            print("\nSOURCES:\n", out["sources"])
+            text += "\nSOURCES:\n " + out["sources"] + "\n"
+        sys.stdout.flush()
+        sys.stdout.buffer.write(text.encode("utf-8"))
+        sys.stdout.buffer.flush()
         return
 
     print(USAGE)
@@ -1,33 +1,50 @@
 Certainly! Below is a robust Python data analysis skeleton for battery cycling data, focusing on loading, cleaning, feature extraction, and plotting the capacity vs cycle. This example assumes you have a CSV file with columns such as 'cycle', 'capacity', and 'voltage'.
 
 ```python
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
-# Load the data
+# Load the data (only the columns used below, with compact dtypes; needs pyarrow).
+# 'Int32' is nullable, so a blank cycle cell loads as <NA> instead of failing the read;
+# those rows cannot be assigned to a cycle and are dropped before the cast to int32.
 def load_data(file_path):
     try:
-        data = pd.read_csv(file_path)
-        return data
+        data = pd.read_csv(
+            file_path,
+            usecols=['cycle', 'capacity'],
+            dtype={'cycle': 'Int32', 'capacity': 'float32'},
+            engine='pyarrow',
+        )
+        return data.dropna(subset=['cycle']).astype({'cycle': 'int32'})
     except FileNotFoundError:
         print("File not found.")
         return None
 
-# Clean the data (example: remove rows with missing values)
-def clean_data(data):
+# Feature extraction (average capacity per cycle, in a single pass).
+# No dropna on capacity: mean() skips missing capacities on its own.
+def extract_features(data):
     if data is not None:
-        data.dropna(inplace=True)
-        return data
+        return data.groupby('cycle', as_index=False)['capacity'].mean()
     else:
         return None
 
-# Feature extraction (example: calculate average capacity per cycle)
-def extract_features(data):
-    if data is not None:
-        avg_capacity_per_cycle = data.groupby('cycle')['capacity'].mean().reset_index()
-        return avg_capacity_per_cycle
-    else:
+# Same per-cycle mean for very large files: plain NumPy arrays and two
+# np.bincount reductions instead of a hash-based groupby.
+# Cycle numbers must be non-negative; cycles without any capacity value are left out.
+def extract_features_fast(data):
+    if data is None:
         return None
+    cycle = data['cycle'].to_numpy(np.int32)
+    capacity = data['capacity'].to_numpy(np.float32)
+    valid = ~np.isnan(capacity)
+    sums = np.bincount(cycle[valid], weights=capacity[valid])
+    counts = np.bincount(cycle[valid], minlength=len(sums))
+    present = np.flatnonzero(counts)
+    return pd.DataFrame({
+        'cycle': present.astype(np.int32),
+        'capacity': (sums[present] / counts[present]).astype(np.float32),
+    })
 
 # Plot the data
 def plot_data(data):
@@ -46,8 +63,7 @@ def plot_data(data):
 def main():
     file_path = 'battery_data.csv'  # Replace with your file path
     data = load_data(file_path)
-    cleaned_data = clean_data(data)
-    features = extract_features(cleaned_data)
+    features = extract_features_fast(data)  # or extract_features(data)
     plot_data(features)
 
 if __name__ == "__main__":
@@ -55,13 +71,13 @@ if __name__ == "__main__":
 ```
 
 ### Explanation:
-- **Load Data**: The `load_data` function reads a CSV file using `pandas`.
-- **Clean Data**: The `clean_data` function removes rows with missing values.
-- **Extract Features**: The `extract_features` function calculates the average capacity per cycle.
+- **Load Data**: The `load_data` function reads only the `cycle` and `capacity` columns with 32-bit dtypes, using the pyarrow CSV parser. `cycle` is read as nullable `Int32` so blank cells do not abort the read; rows without a cycle are dropped and the column is cast to `int32`.
+- **Extract Features**: The `extract_features` function calculates the average capacity per cycle in one groupby; missing capacities are ignored by the mean, so they need no cleaning pass.
+- **Extract Features (fast)**: `extract_features_fast` computes the same means with `np.bincount` on contiguous arrays; it is used by `main` and pays off on million-row files.
 - **Plot Data**: The `plot_data` function uses `matplotlib` to plot the capacity vs cycle.
 - **Main Function**: The `main` function orchestrates the data processing pipeline.
 
 ### Notes:
-- Ensure you have the necessary libraries installed (`pandas` and `matplotlib`).
+- Ensure you have the necessary libraries installed (`numpy`, `pandas`, `pyarrow` and `matplotlib`).
 - Replace `'battery_data.csv'` with the path to your actual CSV file.
 - This skeleton provides a basic framework. Depending on your specific needs, you may need to add more sophisticated cleaning or feature extraction steps.